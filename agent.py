@@ -9,6 +9,7 @@ class InfectionState(enum.IntEnum):
     CLEAN = 0
     INFECTED = 1
     RECOVERED = 2
+    DEAD = 3
 
 
 class QuarantineState(enum.IntEnum):
@@ -17,6 +18,24 @@ class QuarantineState(enum.IntEnum):
     FREE = 4
 
 
+"""Plain int values of the states for the code that runs for every agent or cell, comparing
+ints is cheaper than comparing IntEnum members"""
+
+_CLEAN = int(InfectionState.CLEAN)
+_INFECTED = int(InfectionState.INFECTED)
+_RECOVERED = int(InfectionState.RECOVERED)
+_DEAD = int(InfectionState.DEAD)
+_QUARANTINE = int(QuarantineState.QUARANTINE)
+
+
+"""Actions an agent can choose from. An action is referred to by its index in ACTIONS, which is
+also the column of the action in the probability and payoff arrays"""
+
+STAY_IN = 0
+ACTIONS = ("Stay In", "Party", "Buy grocery", "Help elderly")
+ACTION_PAYOFF = np.array([0.4, 0.7, 0.5, 0.5])  # payoff for each action, in the order of ACTIONS
+
+
 class MainAgent(Agent):
     def __init__(self, unique_id, model, pos):
         """Agent class which has all the parameters and functions
@@ -26,9 +45,11 @@ class MainAgent(Agent):
             self.quarantinestate: indicates the state of quarantine of an agent
             self.aspiration: indicates the aspiration of an agent, initialized with global aspiration from the mainmodel
             self.habituation: indicates the habituation level of an agent
-            self.action_payoff: payoff for each action chosen by an agent
             self.action_prob: probability of choosing an action, go out is divided into 3 sub actions
+            self.action_done: name of the action chosen by the agent in the current step, None before the first step
 
+        The infection and quarantine states, the infected time, the cell, the aspiration and the action
+        probabilities of the agent are stored in the state arrays of the model, indexed by unique_id.
         """
         super().__init__(unique_id, model)  # inherit the parent class
         self.infectionstate = InfectionState.CLEAN
@@ -37,33 +58,88 @@ class MainAgent(Agent):
 
         self.aspiration = self.model.global_aspiration
         self.habituation = self.model.habituation
-        self.action_payoff = {
-            "Stay In": 0.4,
-            "Party": 0.7,
-            "Buy grocery": 0.5,
-            "Help elderly": 0.5
-        }
-
-        self.action_prob = {
-            "Stay In": 0.5,
-            "Party": 0.5 / 3,
-            "Buy grocery": 0.5 / 3,
-            "Help elderly": 0.5 / 3
-        }
+
+        self.action_prob[:] = [0.5, 0.5 / 3, 0.5 / 3, 0.5 / 3]  # in the order of ACTIONS
 
         self.stimulus = list()
-        self.action_done = list()
+        self.action_done = None
+
+    @property
+    def infectionstate(self):
+        """Infection state of the agent, read from the infection_states array of the model"""
+        return InfectionState(self.model.infection_states[self.unique_id])
+
+    @infectionstate.setter
+    def infectionstate(self, state):
+        self.model.transition(self, self.model.infection_states[self.unique_id], state)
+
+    @property
+    def quarantinestate(self):
+        """Quarantine state of the agent, read from the quarantine_states array of the model"""
+        return QuarantineState(self.model.quarantine_states[self.unique_id])
+
+    @quarantinestate.setter
+    def quarantinestate(self, state):
+        self.model.quarantine_states[self.unique_id] = state
+
+    @property
+    def infected_time(self):
+        """Time at which the agent got infected, read from the infected_time array of the model"""
+        return int(self.model.infected_time[self.unique_id])
+
+    @infected_time.setter
+    def infected_time(self, time):
+        self.model.infected_time[self.unique_id] = time
+
+    @property
+    def aspiration(self):
+        """Aspiration of the agent, read from the aspiration array of the model"""
+        return self.model.aspiration[self.unique_id]
+
+    @aspiration.setter
+    def aspiration(self, aspiration):
+        self.model.aspiration[self.unique_id] = aspiration
+
+    @property
+    def action_prob(self):
+        """Probability of every action in ACTIONS, a view on the row of the agent in the action_prob
+        array of the model
+        """
+        return self.model.action_prob[self.unique_id]
 
-    def action_picker(self):
-        """Agent chooses an action to do in the current step of the simulation and appends it
-        to the list of action done.
+    @property
+    def last_action(self):
+        """Index in ACTIONS of the action chosen in the current step, read from the last_actions
+        array of the model
         """
+        return self.model.last_actions[self.unique_id]
+
+    @property
+    def pos(self):
+        """Position of the agent on the grid, set by the grid when the agent is placed, moved or removed"""
+        return self._pos
+
+    @pos.setter
+    def pos(self, pos):
+        self._pos = pos
+        self.model.set_agent_cell(self, pos)
+
+    def action_picker(self, draw=None):
+        """Agent chooses an action to do in the current step of the simulation and stores it
+        as the action done.
+
+        Parameters:
+            draw: uniform random number used to pick the action, drawn for all the agents at once by
+                the scheduler. A number is drawn from the generator of the model if it is not given
+        """
+
+        action_prob = self.action_prob
 
         if self.model.lockdown==True:
-            action_probability_stayin_t0 = self.action_prob['Stay In']
+            action_probability_stayin_t0 = action_prob[STAY_IN]
 
             # Add effect of government stringent to the action probabilities
-            action_probability_stayin_t1 = self.action_prob['Stay In'] + (
+            action_probability_stayin_t1 = action_prob[STAY_IN] + (
                 self.model.government_stringent / 100)
 
             action_probability_adjust = (
@@ -71,52 +147,50 @@ class MainAgent(Agent):
 
             probability_error = False  # Check that there is no probability goes below 0
 
-            for key in list(self.action_prob.keys()):
-                if key != 'Stay In':
-                    if ((self.action_prob[key] -
+            for action in range(len(ACTIONS)):
+                if action != STAY_IN:
+                    if ((action_prob[action] -
                          action_probability_adjust) < 0):
                         probability_error = True
                         break
 
             if probability_error is False:
-                self.action_prob['Stay In'] = self.action_prob['Stay In'] + \
+                action_prob[STAY_IN] = action_prob[STAY_IN] + \
                     (self.model.government_stringent / 100)
-                for key in list(self.action_prob.keys()):
-                    if key != 'Stay In':
-                        self.action_prob[key] = self.action_prob[key] - \
+                for action in range(len(ACTIONS)):
+                    if action != STAY_IN:
+                        action_prob[action] = action_prob[action] - \
                             action_probability_adjust
 
-        if (self.quarantinestate == QuarantineState.QUARANTINE):
-            action = "Stay In"
+        if (self.model.quarantine_states[self.unique_id] == _QUARANTINE):
+            action = STAY_IN
         else:
-            action = np.random.choice(  # Agent picks an action to perform.
-                list(
-                    self.action_prob.keys()), p=list(
-                    self.action_prob.values()))
+            if draw is None:
+                draw = self.model.rng.random()
+            # Agent picks an action to perform, the first one whose cumulative probability is above the draw
+            action = min(int(np.searchsorted(np.cumsum(action_prob), draw, side="right")),
+                         len(ACTIONS) - 1)
 
-        # Append the action chosen by the agent
-        self.action_done.append(action)
+        # Store the action chosen by the agent
+        self.action_done = ACTIONS[action]
+        self.model.last_actions[self.unique_id] = action
 
     def action_outcome_spread(self):
         """Agent spreads the virus depending on the state of himself and his neighbours
         """
 
-        possible_spread_list = self.model.grid.get_neighborhood(
-            self.pos, moore=True, include_center=False)
-
-        for neighbour in possible_spread_list:
-            if ((self.model.grid.is_cell_empty(neighbour) is False) and (
-                    self.model.grid.get_cell_list_contents(neighbour)[0].infectionstate == InfectionState.INFECTED)):
-                action_performed = self.action_done[-1]
+        for neighbour in self.model.neighbors_of(self.unique_id):
+            if self.model.infection_states[neighbour] == InfectionState.INFECTED:
+                action_performed = self.last_action
 
-                if (self.random.random() <= self.model.action_infection_prob[action_performed] and
+                if (self.model.rng.random() <= self.model.action_infection_prob[action_performed] and
                         (self.infectionstate == InfectionState.CLEAN)):
                     self.infectionstate = InfectionState.INFECTED
                     self.infected_time = self.model.schedule.time
 
                     # A fraction of agents choose to self quarantine on being
                     # infected
-                    if (self.random.random() <= self.model.quarantine_prob):
+                    if (self.model.rng.random() <= self.model.quarantine_prob):
                         self.quarantinestate = QuarantineState.QUARANTINE
 
     def social_dilemma_influence(self):
@@ -127,16 +201,18 @@ class MainAgent(Agent):
         if self.model.lockdown == True:
 
 	        payoff = 0
-	        action_performed = self.action_done[-1]
+	        action_performed = self.last_action
+	        action_prob = self.action_prob
 
-	        if (self.infectionstate == InfectionState.INFECTED and self.model.schedule.time -
+	        infected = self.model.infection_states[self.unique_id] == _INFECTED
+	        if (infected and self.model.schedule.time -
 	                self.infected_time == 0):  # Agent recieves no payoff on being infected.
 	            payoff = 0
 	        else:
-	            payoff = self.action_payoff[action_performed]
+	            payoff = ACTION_PAYOFF[action_performed]
 	        stimulus = payoff - self.aspiration
 
-	        if (stimulus < 0 and self.infectionstate != InfectionState.INFECTED):
+	        if (stimulus < 0 and not infected):
 	            """if the agent isn't infected but recieves a pay off lower than the
 	            aspiration, the agent explores other action
 	            """
@@ -144,7 +220,7 @@ class MainAgent(Agent):
 	        else:
 	            self.aspiration = self.aspiration * \
 	                (1 - self.habituation) + self.habituation * payoff
-	            action_probability_t0 = self.action_prob[action_performed]
+	            action_probability_t0 = action_prob[action_performed]
 	            action_probability_t1 = 0
 
 	            if (stimulus > 0):  # Update probability of doing an action
@@ -163,26 +239,25 @@ class MainAgent(Agent):
 	                action_probability_t1 - action_probability_t0) / (self.model.action_count - 1)
 
 	            probability_error = False
-	            for key in list(self.action_prob.keys(
-	            )):  # Ensure the probability for actions are never negative
-	                if (key != action_performed):
-	                    if ((self.action_prob[key] - probability_adjust) < 0):
+	            for action in range(len(ACTIONS)):  # Ensure the probability for actions are never negative
+	                if (action != action_performed):
+	                    if ((action_prob[action] - probability_adjust) < 0):
 	                        probability_error = True
 	                        break
 
 	            if (probability_error is False):
-	                self.action_prob[action_performed] = action_probability_t1
-	                for key in list(self.action_prob.keys()):
-	                    if (key != action_performed):
-	                        self.action_prob[key] = (
-	                            self.action_prob[key] - probability_adjust)
+	                action_prob[action_performed] = action_probability_t1
+	                for action in range(len(ACTIONS)):
+	                    if (action != action_performed):
+	                        action_prob[action] = (
+	                            action_prob[action] - probability_adjust)
 
     def move(self):
         """If the agent is not staying in, move to an empty cell
         """
 
-        if (self.action_done[-1] != "Stay In"):
-            self.model.grid.move_to_empty(self)
+        if (self.last_action != STAY_IN):
+            self.model.move_to_empty(self)
 
     def update_status(self):
         """Update agents from:
@@ -196,11 +271,11 @@ class MainAgent(Agent):
                 ((self.model.schedule.time - self.infected_time) > self.model.recovery_days * 0.666) and
                 ((self.model.schedule.time - self.infected_time) < self.model.recovery_days)):
 
-            if (np.random.choice([0, 1], p=[
-                    1 - self.model.death_rate, self.model.death_rate]) == 1):
+            if (self.model.rng.random() < self.model.death_rate):
+                self.infectionstate = InfectionState.DEAD
+                self.model.last_actions[self.unique_id] = -1
                 self.model.grid.remove_agent(self)
                 self.model.schedule.remove(self)
-                self.model.dead_agents_number = self.model.dead_agents_number + 1
         elif (self.model.recovery_days < (self.model.schedule.time - self.infected_time)
               and self.infectionstate == InfectionState.INFECTED):
             self.infectionstate = InfectionState.RECOVERED
@@ -212,11 +287,13 @@ class MainAgent(Agent):
         """Set equal probabilities of performaing an action to make agent pick
         a different action to avaoid SCE
         """
-        for key in self.action_prob.keys():
-            if (key == self.action_done[-1]):
-                self.action_prob[key] = 0.1
+        action_prob = self.action_prob
+        action_performed = self.last_action
+        for action in range(len(ACTIONS)):
+            if (action == action_performed):
+                action_prob[action] = 0.1
             else:
-                self.action_prob[key] = 0.3
+                action_prob[action] = 0.3
 
     def step(self):
         self.action_picker()
@@ -226,4 +303,4 @@ class MainAgent(Agent):
         self.update_status()
 
         self.model.dilemma_list.append(
-            [int(self.model.schedule.time), self.action_done[-1]])
+            [int(self.model.schedule.time), self.action_done])
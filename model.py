@@ -1,40 +1,22 @@
 from mesa import Model
 from mesa.space import SingleGrid
 from mesa.datacollection import DataCollector
-from mesa.time import RandomActivation
 import numpy as np
 
-from agent import MainAgent
+from agent import MainAgent, InfectionState, QuarantineState, ACTIONS, STAY_IN
+from agent import _CLEAN, _INFECTED, _RECOVERED, _DEAD, _QUARANTINE
+from scheduler import FastRandomActivation
+from sir_kernel import sir_spread, sir_update_status
 
-import enum
 import csv
 import os
 
-"""infection and quarantine states"""
-
-
-class InfectionState(enum.IntEnum):
-    """Infected states to keep track"""
-    CLEAN = 0
-    INFECTED = 1
-    RECOVERED = 2
-    DEAD = 3
-
-
-class QuarantineState(enum.IntEnum):
-    """Quarantine states to keep track"""
-    QUARANTINE = 3
-    FREE = 4
-
-
 def get_susceptible_number(model):
     """Get number of susceptible agents
 
     Returns: total number of susceptible agents
     """
-    susceptible_agents = [
-        a for a in model.schedule.agents if a.infectionstate == InfectionState.CLEAN]
-    return len(susceptible_agents)
+    return model._inf_hist[_CLEAN]
 
 
 def get_infected_number(model):
@@ -42,9 +24,7 @@ def get_infected_number(model):
 
     Returns: total number of infected agents
     """
-    infected_agents = [
-        a for a in model.schedule.agents if a.infectionstate == InfectionState.INFECTED]
-    return len(infected_agents)
+    return model._inf_hist[_INFECTED]
 
 
 def get_recovered_number(model):
@@ -52,9 +32,7 @@ def get_recovered_number(model):
 
     Returns: total number of recovered agents
     """
-    recovered_agents = [
-        a for a in model.schedule.agents if a.infectionstate == InfectionState.RECOVERED]
-    return len(recovered_agents)
+    return model._inf_hist[_RECOVERED]
 
 
 def get_dead_number(model):
@@ -62,7 +40,7 @@ def get_dead_number(model):
 
     Returns : total number of dead agents
     """
-    return model.dead_agents_number
+    return model._inf_hist[_DEAD]
 
 
 def get_stay_in(model):
@@ -70,12 +48,7 @@ def get_stay_in(model):
 
     Returns: Total number of agents that are staying in at current step
     """
-    try:
-        stay_in_number = [
-            a for a in model.schedule.agents if a.action_done[-1] == 'Stay In']
-        return len(stay_in_number)
-    except Exception:
-        return 0
+    return model._stats["stay_in"]
 
 
 def get_go_out(model):
@@ -83,12 +56,7 @@ def get_go_out(model):
 
     Returns: Total number of agents that go out at current step
     """
-    try:
-        go_out_number = [
-            a for a in model.schedule.agents if a.action_done[-1] != 'Stay In']
-        return len(go_out_number)
-    except Exception:
-        return 0
+    return model._stats["go_out"]
 
 
 def get_average_aspiration(model):
@@ -96,10 +64,7 @@ def get_average_aspiration(model):
 
     Returns: average aspiration of all the agents in population
     """
-    aspiration_list = []
-    for i, a in enumerate(model.schedule.agents):
-        aspiration_list.append(a.aspiration)
-    return (sum(aspiration_list))
+    return model._stats["average_aspiration"]
 
 
 def get_average_stay_in(model):
@@ -107,11 +72,7 @@ def get_average_stay_in(model):
 
     Returns: average probability of all agents who are staying in
     """
-    stay_in_list = []
-    for i, a in enumerate(model.schedule.agents):
-        stay_in_list.append(a.action_prob["Stay In"])
-
-    return (sum(stay_in_list) / i)
+    return model._stats["average_stay_in"]
 
 
 def get_average_go_out(model):
@@ -119,14 +80,7 @@ def get_average_go_out(model):
 
     Returns: average action probability of all agents of the action going out
     """
-    go_out_list = []
-    for i, a in enumerate(model.schedule.agents):
-        go_out_list.append(
-            (a.action_prob["Party"] +
-             a.action_prob["Help elderly"] +
-             a.action_prob["Buy grocery"]))
-
-    return (sum(go_out_list) / i)
+    return model._stats["average_go_out"]
 
 
 class MainModel(Model):
@@ -141,7 +95,7 @@ class MainModel(Model):
     def __init__(self, population_density, death_rate, transfer_rate,
                  initial_infection_rate, width, height, government_stringent,
                  government_action_threshold, global_aspiration,
-                 recovery_days=11, habituation=0.1, learning_rate=0.1, ):
+                 recovery_days=11, habituation=0.1, learning_rate=0.1, seed=None, collect_every=1):
         """Model class which has all the model paramaters and functions
 
         Parameters:
@@ -153,6 +107,8 @@ class MainModel(Model):
             self.initial_infection_rate: Total number of agents who are infected at the start of the simulation
             self.recovery_days: Number of days taken by an agent to recover if he gets infected
             self.dead_agents_number: variable to hold the total number of dead agents
+            self._inf_hist: number of agents in each infection state, indexed by the state and updated on
+                every change of state in transition(), spread_virus() and update_status()
 
             self.government_action_threshold: A threshold of infection rate after which the government imposes lockdown
             self.government_stringent: The strictness of the government after imposing lockdown
@@ -162,8 +118,30 @@ class MainModel(Model):
             self.habituation: the habituation of the agents - sensitivity to the change in stimulus of action
             self.learning_rate: learning rate of the agents - controls rate of change of aspiration level
             self.global_aspiration: initial global aspiration of the population
-            self.action_infection_prob: Probability of getting infected for a particular action
+            self.action_infection_prob: Probability of getting infected for each action, in the order of agent.ACTIONS
+
+            self.collect_every: the model reporters are collected every collect_every (at least 1) steps, the rows of
+                the datacollector are then collect_every steps apart
+
+            self.rng: random generator used for all the random draws of the model and the agents, seeded
+                with seed
+
+            self.infection_states: infection state of every agent, indexed by unique_id
+            self.quarantine_states: quarantine state of every agent, indexed by unique_id
+            self.last_actions: index in agent.ACTIONS of the last action of every agent, -1 if the agent
+                has not acted yet or is dead
+            self.infected_time: time at which every agent got infected, indexed by unique_id
+            self.aspiration: aspiration of every agent, indexed by unique_id
+            self.action_prob: probability of every action in agent.ACTIONS for every agent, one row per agent
+            self.agent_cells: cell (x * height + y) of every agent, -1 if the agent is not on the grid
+            self.cell_agents: unique_id of the agent on every cell, -1 if the cell is empty
+            self.neighbors_ptr, self.neighbors_idx: Moore neighbourhood of every cell in CSR format
         """
+        if collect_every < 1:
+            raise ValueError("collect_every has to be at least 1, got {}".format(collect_every))
+
+        self.rng = np.random.default_rng(seed)
+
         self.population_density = population_density
         self.death_rate = death_rate
         self.width = width
@@ -171,7 +149,7 @@ class MainModel(Model):
         self.transfer_rate = transfer_rate
         self.initial_infection_rate = initial_infection_rate
         self.recovery_days = recovery_days
-        self.dead_agents_number = 0
+        self._inf_hist = [0] * len(InfectionState)
 
         self.government_action_threshold = government_action_threshold
         self.government_stringent = government_stringent
@@ -184,15 +162,11 @@ class MainModel(Model):
         self.learning_rate = learning_rate
         self.global_aspiration = global_aspiration
         self.action_count = 4
-        self.action_infection_prob = {
-            "Stay In": 0.1,
-            "Party": 0.7,
-            "Buy grocery": 0.5,
-            "Help elderly": 0.5
-        }
+        self.action_infection_prob = np.array([0.1, 0.7, 0.5, 0.5])
 
         """graphing parameters"""
 
+        self.collect_every = collect_every
         self.step_counter = 0
         self.dilemma_list = []
         self.stay_in_list = []
@@ -201,30 +175,55 @@ class MainModel(Model):
         self.aspiration_list = []
         self.infection_list = []
 
+        """State arrays of the agents, indexed by unique_id"""
+
+        self.infection_states = np.zeros(width * height, dtype=np.int8)
+        self.quarantine_states = np.zeros(width * height, dtype=np.int8)
+        self.last_actions = np.full(width * height, -1, dtype=np.int8)
+        self.infected_time = np.zeros(width * height, dtype=np.int32)
+        self.aspiration = np.zeros(width * height, dtype=np.float64)
+        self.action_prob = np.zeros((width * height, len(ACTIONS)), dtype=np.float64)
+        self.agent_cells = np.full(width * height, -1, dtype=np.int32)
+        self.cell_agents = np.full(width * height, -1, dtype=np.int32)
+
         self.grid = SingleGrid(width, height, True)
-        self.schedule = RandomActivation(self)
-        i = 0
+        self.schedule = FastRandomActivation(self)
+
+        """The neighbourhood of the cells does not change, store it once for the SIR kernel"""
+
+        neighborhoods = [[nx * height + ny for nx, ny in self.grid.get_neighborhood((x, y), moore=True)]
+                         for _, x, y in self.grid.coord_iter()]
+        self.neighbors_ptr = np.zeros(len(neighborhoods) + 1, dtype=np.int32)
+        self.neighbors_ptr[1:] = np.cumsum([len(cells) for cells in neighborhoods])
+        self.neighbors_idx = np.array([cell for cells in neighborhoods for cell in cells], dtype=np.int32)
+        self.max_neighbors = max(len(cells) for cells in neighborhoods)
 
-        """Get all the cells in SingleGrid"""
-        for cell in self.grid.coord_iter():
-            x, y = cell[1], cell[2]
+        """Get all the cells in SingleGrid and pick the cells to populate and the agents to infect,
+        one random draw for all the cells and one for all the agents"""
 
-            """Add agents and infect them with initial infection rate"""
+        cells = [(x, y) for _, x, y in self.grid.coord_iter()]
+        populated_mask = self.rng.random(len(cells)) < self.population_density
+        cells = [cell for cell, populated in zip(cells, populated_mask) if populated]
+        infect_mask = self.rng.random(len(cells)) < self.initial_infection_rate
 
-            if self.random.random() < self.population_density:
-                agent = MainAgent(i, self, (x, y))
+        """Add agents and infect them with initial infection rate"""
 
-                if (np.random.choice([0, 1], p=[
-                        1 - self.initial_infection_rate, self.initial_infection_rate])) == 1:
-                    agent.infectionstate = InfectionState.INFECTED
-                    agent.quarantinestate = QuarantineState.FREE
-                    agent.infected_time = self.schedule.time
+        for i, (x, y) in enumerate(cells):
+            agent = MainAgent(i, self, (x, y))
+            self._inf_hist[_CLEAN] = self._inf_hist[_CLEAN] + 1
 
-                self.grid.position_agent(agent, (x, y))
-                self.schedule.add(agent)
-                i = i + 1
+            if infect_mask[i]:
+                agent.infectionstate = InfectionState.INFECTED
+                agent.quarantinestate = QuarantineState.FREE
+                agent.infected_time = self.schedule.time
 
-        self.total_population = i
+            self.grid.position_agent(agent, (x, y))
+            self.schedule.add(agent)
+
+        self.total_population = len(cells)
+
+        self._stats = {}
+        self._update_stats()
 
         self.running = True
 
@@ -237,29 +236,23 @@ class MainModel(Model):
                 "Go Out": get_go_out,
                 "Susceptible": get_susceptible_number,
                 "Aspiration": get_average_aspiration,
-                "Average Aspiration": get_average_aspiration,
                 "Average Stay In": get_average_stay_in,
                 "Average Get Out": get_average_go_out,
 
             },
-
-            agent_reporters={
-                "QuarantineState": "quarantinestate",
-                "InfectionState": "infectionstate",
-            },
         )
 
     def step(self):
 
         self.step_counter = self.step_counter + 1
 
-        self.datacollector.collect(self)
-        self.schedule.step()
+        if self.schedule.steps % self.collect_every == 0:
+            self.datacollector.collect(self)
+        self.step_agents()
 
         """Impose lockdown if infection number goes above the given threshold"""
 
-        if ((self.get_infection_number() / self.total_population)
-                > self.government_action_threshold):
+        if self.get_infection_rate() > self.government_action_threshold:
             self.lockdown = True
 
         """If the virus is iradicated, stop the simulation"""
@@ -267,87 +260,174 @@ class MainModel(Model):
                 == self.total_population):
             self.running = False
 
+    def step_agents(self):
+        """Step all the agents with the schedule, see FastRandomActivation for the order of the
+        phases, and update the statistics for the reporters
+        """
+        self.schedule.step()
+        self._update_stats()
+
+    def spread_virus(self):
+        """Run the spreading part of the SIR kernel on the state arrays and move the agents that
+        got infected to the infected count
+        """
+        n = self.total_population
+
+        infected = sir_spread(
+            self.infection_states, self.quarantine_states, self.infected_time, self.last_actions,
+            self.agent_cells, self.cell_agents, self.neighbors_ptr, self.neighbors_idx,
+            self.action_infection_prob, self.quarantine_prob, self.schedule.time,
+            self.rng.random((n, self.max_neighbors)), self.rng.random(n))
+
+        self._inf_hist[_CLEAN] = self._inf_hist[_CLEAN] - infected
+        self._inf_hist[_INFECTED] = self._inf_hist[_INFECTED] + infected
+
+    def update_status(self):
+        """Run the recovery and death part of the SIR kernel on the state arrays, update the state
+        counters with the number of agents that changed state and remove the agents that died from
+        the grid and the schedule
+        """
+        n = self.total_population
+        died = np.zeros(n, dtype=np.bool_)
+
+        recovered, dead = sir_update_status(
+            self.infection_states, self.quarantine_states, self.infected_time, self.agent_cells,
+            self.death_rate, self.recovery_days, self.schedule.time, self.rng.random(n), died)
+
+        self._inf_hist[_INFECTED] = self._inf_hist[_INFECTED] - recovered - dead
+        self._inf_hist[_RECOVERED] = self._inf_hist[_RECOVERED] + recovered
+        self._inf_hist[_DEAD] = self._inf_hist[_DEAD] + dead
+
+        for unique_id in np.flatnonzero(died):
+            agent = self.schedule._agents[unique_id]
+            self.last_actions[unique_id] = -1
+            self.grid.remove_agent(agent)
+            self.schedule.remove(agent)
+
+    def move_to_empty(self, agent):
+        """Move an agent to a random empty cell, found from the cell_agents array"""
+        empty_cells = np.flatnonzero(self.cell_agents < 0)
+        cell = int(empty_cells[self.rng.integers(len(empty_cells))])
+        self.grid.move_agent(agent, (cell // self.height, cell % self.height))
+
+    def neighbors_of(self, agent_id):
+        """Get the neighbours of an agent from the neighbourhood table of its cell
+
+        Returns: unique_ids of the agents on the cells around the agent
+        """
+        cell = self.agent_cells[agent_id]
+        neighbours = self.cell_agents[
+            self.neighbors_idx[self.neighbors_ptr[cell]:self.neighbors_ptr[cell + 1]]]
+        return neighbours[neighbours >= 0]
+
+    def set_agent_cell(self, agent, pos):
+        """Keep the cell arrays in sync with the position of an agent on the grid"""
+        old_cell = self.agent_cells[agent.unique_id]
+        if old_cell >= 0 and self.cell_agents[old_cell] == agent.unique_id:
+            self.cell_agents[old_cell] = -1
+
+        if pos is None:
+            self.agent_cells[agent.unique_id] = -1
+        else:
+            cell = pos[0] * self.height + pos[1]
+            self.agent_cells[agent.unique_id] = cell
+            self.cell_agents[cell] = agent.unique_id
+
+    def transition(self, agent, from_state, to_state):
+        """Change the infection state of an agent and move it from the count of its old state
+        to the count of its new state
+        """
+        self.infection_states[agent.unique_id] = to_state
+        if from_state != to_state:
+            self._inf_hist[from_state] = self._inf_hist[from_state] - 1
+            self._inf_hist[to_state] = self._inf_hist[to_state] + 1
+
+    @property
+    def dead_agents_number(self):
+        """Total number of dead agents"""
+        return self._inf_hist[_DEAD]
+
+    def _update_stats(self):
+        """Count the actions of the living agents and average their aspiration and action
+        probabilities with reductions over the state arrays. The reporters read these values
+        instead of scanning the agents each. The averages are 0 once every agent is dead.
+        """
+        n = self.total_population
+        alive = self.infection_states[:n] != _DEAD
+        last_actions = self.last_actions[:n]
+        action_prob = self.action_prob[:n][alive]
+
+        stay_in = int(np.count_nonzero(last_actions == STAY_IN))
+        acted = int(np.count_nonzero(last_actions >= 0))
+
+        self._stats = {
+            "stay_in": stay_in,
+            "go_out": acted - stay_in,
+            "average_aspiration": 0.0,
+            "average_stay_in": 0.0,
+            "average_go_out": 0.0,
+        }
+
+        if len(action_prob) > 0:
+            self._stats["average_aspiration"] = float(self.aspiration[:n][alive].mean())
+            self._stats["average_stay_in"] = float(action_prob[:, STAY_IN].mean())
+            self._stats["average_go_out"] = float(
+                np.delete(action_prob, STAY_IN, axis=1).sum(axis=1).mean())
+
     def get_stay_in_number(self):
         """Get number of staying in agents, used for graphing and visualization
 
         Returns: the number of agents staying in at that particular step
         """
-        try:
-            stay_in_list = [
-                a for a in self.schedule.agents if a.action_done[-1] == "Stay In"]
-            return len(stay_in_list)
-        except Exception:
-            return 0
+        return self._stats["stay_in"]
 
     def get_stay_out_number(self):
         """Get number of agents going out, used for graphing and visualization
 
         Returns: the number of agents going out at that particular step
         """
-        try:
-            stay_out_list = [
-                a for a in self.schedule.agents if a.action_done[-1] != "Stay In"]
-            return len(stay_out_list)
-        except Exception:
-            return 0
+        return self._stats["go_out"]
 
     def get_avg_aspiration(self):
         """Get average aspiration of the population, used for graphing and visualization
 
         Returns: the average population of the agents at that particular step
         """
-        try:
-            total_aspiration = 0
-            for i, a in enumerate(self.schedule.agents):
-                total_aspiration = total_aspiration + a.aspiration
-            return (total_aspiration / i)
-        except Exception:
+        return self._stats["average_aspiration"]
+
+    def get_infection_rate(self):
+        """Get the fraction of the population that is infected, used for the lockdown decision
+
+        Returns: number of infected agents divided by the initial population, 0 if the grid is empty
+        """
+        if self.total_population == 0:
             return 0
+        return self.get_infection_number() / self.total_population
 
     def get_susceptible_number(self):
         """Get the number of agents that are susceptible to the virus, used for graphing and visualization
 
         Returns: number of agents that are susceptible to the virus until that step
         """
-        susceptible_number = 0
-        for cell in self.grid.coord_iter():
-            if (cell[0] is not None):
-                agent = cell[0]
-                if (agent.infectionstate == InfectionState.CLEAN):
-                    susceptible_number = susceptible_number + 1
-        return susceptible_number
+        return self._inf_hist[_CLEAN]
 
     def get_infection_number(self):
         """Get the number of agents that are infected to the virus, used for graphing and visualization
 
         Returns: number of agents that are infected to the virus until that step
         """
-
-        infected_number = 0
-        for cell in self.grid.coord_iter():
-            if (cell[0] is not None):
-                agent = cell[0]
-                if (agent.infectionstate == InfectionState.INFECTED):
-                    infected_number = infected_number + 1
-        return infected_number
+        return self._inf_hist[_INFECTED]
 
     def get_recovered_number(self):
         """Get the number of agents who recovered from the virus, used for graphing and visualization
 
         Returns: number of agents that recovered from the virus until that step
         """
-
-        recovered_number = 0
-        for cell in self.grid.coord_iter():
-            if (cell[0] is not None):
-                agent = cell[0]
-                if (agent.infectionstate == InfectionState.RECOVERED):
-                    recovered_number = recovered_number + 1
-        return recovered_number
+        return self._inf_hist[_RECOVERED]
 
     def get_dead_number(self):
         """Get the number of agents who died from the virus, used for graphing and visualization
 
         Returns: number of agents that died from the virus until that step
         """
-        return self.dead_agents_number
+        return self._inf_hist[_DEAD]
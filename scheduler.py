@@ -0,0 +1,93 @@
+from mesa.time import RandomActivation
+import numpy as np
+
+from agent import MainAgent
+
+
+class FastRandomActivation(RandomActivation):
+
+    """Random activation for the agents of MainModel. The unique_ids of the agents are kept in a
+    NumPy array which is shuffled in place with the random generator of the model every step, and
+    the agents are looked up in a list indexed by unique_id.
+
+    The agents step in phases: they first choose an action, from one batch of random numbers drawn
+    for all the agents, and move, then the SIR kernel of the model spreads the virus to all the agents
+    at once, then the agents update their aspiration and action probabilities, and finally the kernel
+    lets the infected agents recover or die. This is the order of MainAgent.step. If an agent class
+    overrides MainAgent.step, its step is not split in these phases and the scheduler falls back to
+    the sequential RandomActivation.step.
+    """
+
+    def __init__(self, model):
+        super().__init__(model)
+        self._by_id = []  # agents indexed by unique_id, None once removed
+        self._ids = np.empty(0, dtype=np.int32)
+        self._ids_stale = False
+        self._phased = True
+
+    def add(self, agent):
+        super().add(agent)
+        missing = agent.unique_id + 1 - len(self._by_id)
+        if missing > 0:
+            self._by_id.extend([None] * missing)
+        self._by_id[agent.unique_id] = agent
+        self._ids_stale = True
+        if type(agent).step is not MainAgent.step:
+            self._phased = False
+
+    def remove(self, agent):
+        super().remove(agent)
+        self._by_id[agent.unique_id] = None
+        self._ids_stale = True
+
+    def _shuffled_ids(self):
+        """Shuffle the unique_ids of the scheduled agents with the random generator of the model.
+        The id array is only rebuilt when agents were added or removed since the last step.
+
+        Returns: list of the unique_ids in the order of activation
+        """
+        if self._ids_stale:
+            self._ids = np.array([unique_id for unique_id, agent in enumerate(self._by_id)
+                                  if agent is not None], dtype=np.int32)
+            self._ids_stale = False
+        self.model.rng.shuffle(self._ids)
+        return self._ids.tolist()
+
+    def agent_buffer(self, shuffled=False):
+        """Yield the agents as BaseScheduler.agent_buffer does, but shuffle them with the random
+        generator of the model instead of the random module of Mesa
+        """
+        if not shuffled:
+            yield from super().agent_buffer(shuffled)
+            return
+
+        for unique_id in self._shuffled_ids():
+            agent = self._by_id[unique_id]
+            if agent is not None:
+                yield agent
+
+    def step(self):
+        if not self._phased:
+            super().step()
+            return
+
+        ids = self._shuffled_ids()
+        agents = self._by_id
+        draws = self.model.rng.random(len(ids)).tolist()
+
+        for unique_id, draw in zip(ids, draws):
+            agent = agents[unique_id]
+            agent.action_picker(draw)
+            agent.move()
+            self.model.dilemma_list.append(
+                [int(self.time), agent.action_done])
+
+        self.model.spread_virus()
+
+        for unique_id in ids:
+            agents[unique_id].social_dilemma_influence()
+
+        self.model.update_status()
+
+        self.steps += 1
+        self.time += 1
@@ -5,7 +5,7 @@ from Visualizatons_module.CanvasGridVisualization import CanvasGrid
 from Visualizatons_module.ChartVisualization import ChartModule
 from Visualizatons_module.TextDisplay import TextDisplay
 
-from model import MainModel, InfectionState, QuarantineState
+from model import MainModel, _CLEAN, _INFECTED, _RECOVERED, _QUARANTINE
 
 """Declare colorcodes for different agent states"""
 
@@ -54,13 +54,16 @@ def draw(agent):
 
     portrayal = {"Shape": "circle", "r": 0.5, "Filled": "true", "Layer": 0}
 
-    if agent.infectionstate == InfectionState.CLEAN:
+    infectionstate = int(agent.model.infection_states[agent.unique_id])
+    quarantinestate = int(agent.model.quarantine_states[agent.unique_id])
+
+    if infectionstate == _CLEAN:
         portrayal["Color"] = clean_color
-    elif agent.infectionstate == InfectionState.RECOVERED:
+    elif infectionstate == _RECOVERED:
         portrayal["Color"] = recovered_color  # green
-    elif agent.quarantinestate == QuarantineState.QUARANTINE:
+    elif quarantinestate == _QUARANTINE:
         portrayal["Color"] = quarantine_color  # orange
-    elif agent.infectionstate == InfectionState.INFECTED:
+    elif infectionstate == _INFECTED:
         portrayal["Color"] = infected_color
 
     return portrayal
@@ -0,0 +1,115 @@
+import platform
+
+from agent import InfectionState, QuarantineState
+
+"""Compiled steps of the SIR part of the model, run on the state arrays of MainModel. numba is
+not available on PyPy, there the kernels run as plain Python loops."""
+
+PYPY = platform.python_implementation() == "PyPy"
+
+if not PYPY:
+    import numba
+    from numba import njit, prange
+else:
+    prange = range
+
+    def njit(*args, **kwargs):
+        """Leave the function as it is when numba is not available"""
+        return lambda function: function
+
+
+def set_num_threads(n):
+    """Set the number of threads used by the parallel kernel, 1 when the simulations themselves
+    run in parallel processes. Does nothing on PyPy.
+    """
+    if not PYPY:
+        numba.set_num_threads(n)
+
+
+@njit(parallel=True, cache=True)
+def sir_spread(infection_states, quarantine_states, infected_time, last_actions, agent_cells,
+               cell_agents, neighbors_ptr, neighbors_idx, action_infection_prob, quarantine_prob, t,
+               spread_draws, quarantine_draws):
+    """Spread the virus from the infected agents to their neighbours. All agents are updated at
+    once from the states at the start of the step, so the agents are independent and the loop runs
+    in parallel.
+
+    Parameters:
+        infection_states, quarantine_states, infected_time, last_actions: state arrays of the
+            agents, indexed by unique_id. The first three are updated in place
+        agent_cells: cell of every agent, -1 if the agent is not on the grid
+        cell_agents: agent on every cell, -1 if the cell is empty
+        neighbors_ptr, neighbors_idx: neighbourhood of every cell in CSR format, the neighbours of
+            cell c are neighbors_idx[neighbors_ptr[c]:neighbors_ptr[c + 1]]
+        action_infection_prob: probability of getting infected for every action
+        quarantine_prob: probability of an agent to quarantine after he gets infected
+        t: current time of the schedule
+        spread_draws: uniform random numbers, one for every agent and neighbour
+        quarantine_draws: uniform random numbers, one for every agent
+
+    Returns: the number of agents that got infected in this step
+    """
+    n = quarantine_draws.shape[0]
+    states = infection_states[:n].copy()
+    infected = 0
+
+    for i in prange(n):
+        cell = agent_cells[i]
+        if cell < 0 or states[i] != InfectionState.CLEAN:
+            continue
+
+        infection_prob = action_infection_prob[last_actions[i]]
+        start = neighbors_ptr[cell]
+        for k in range(start, neighbors_ptr[cell + 1]):
+            neighbour = cell_agents[neighbors_idx[k]]
+            if (neighbour >= 0 and states[neighbour] == InfectionState.INFECTED and
+                    spread_draws[i, k - start] <= infection_prob):
+                infection_states[i] = InfectionState.INFECTED
+                infected_time[i] = t
+                # A fraction of agents choose to self quarantine on being infected
+                if quarantine_draws[i] <= quarantine_prob:
+                    quarantine_states[i] = QuarantineState.QUARANTINE
+                infected += 1
+                break
+
+    return infected
+
+
+@njit(parallel=True, cache=True)
+def sir_update_status(infection_states, quarantine_states, infected_time, agent_cells,
+                      death_rate, recovery_days, t, death_draws, died):
+    """Let the infected agents die during the critical period of the infection or recover after
+    recovery_days. The agents are independent so the loop runs in parallel.
+
+    Parameters:
+        infection_states, quarantine_states, infected_time: state arrays of the agents, indexed by
+            unique_id. The first two are updated in place
+        agent_cells: cell of every agent, -1 if the agent is not on the grid
+        death_rate: probability of an infected agent to die at each step of the critical period
+        recovery_days: number of steps taken by an agent to recover
+        t: current time of the schedule
+        death_draws: uniform random numbers, one for every agent
+        died: output, set to True for the agents that died in this step
+
+    Returns: the number of agents that recovered and died in this step
+    """
+    n = died.shape[0]
+    recovered = 0
+    dead = 0
+
+    for i in prange(n):
+        if agent_cells[i] < 0 or infection_states[i] != InfectionState.INFECTED:
+            continue
+
+        days = t - infected_time[i]
+        if recovery_days * 0.666 < days < recovery_days:
+            if death_draws[i] < death_rate:
+                infection_states[i] = InfectionState.DEAD
+                died[i] = True
+                dead += 1
+        elif days > recovery_days:
+            infection_states[i] = InfectionState.RECOVERED
+            quarantine_states[i] = QuarantineState.FREE
+            recovered += 1
+
+    return recovered, dead